@@ -0,0 +1,17 @@
+"""
+truPrompt Benchmark Suite
+=========================
+
+Synthesizes agency rosters at configurable scale and times the main truPrompt
+paths end to end:
+
+- TruPromptGenerator.generate_prompt (per agency)
+- run_batch_generation (prompt files written to a scratch outputs/ directory)
+- load_agency_data (eager and lazy)
+- AgencyRecord memory per agency vs. plain dicts
+- util/agency_extractor.py AgencyProcessor.process_outputs_directory
+
+Usage:
+    python -m benchmarks run --sizes 10 1000 10000 --out bench.json
+    python -m benchmarks compare baseline.json bench.json --threshold 0.15
+"""
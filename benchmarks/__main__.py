@@ -0,0 +1,53 @@
+"""Command line entry point: python -m benchmarks {run,compare}"""
+
+import sys
+import json
+import argparse
+
+from benchmarks.compare import compare_results, format_comparison
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="truPrompt benchmark suite")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="run the suite on synthetic rosters")
+    run_parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="roster sizes (10 to 100000)")
+    run_parser.add_argument('--seed', type=int, default=7, help="roster synthesis seed")
+    run_parser.add_argument('--sample', type=int, default=2000, help="agencies timed individually with generate_prompt")
+    run_parser.add_argument('--load-repeat', type=int, default=5, help="load_agency_data repetitions")
+    run_parser.add_argument('--extractor-limit', type=int, default=5000, help="skip the extractor above this roster size")
+    run_parser.add_argument('--section-stats', action='store_true', help="also record per-section time/size statistics")
+    run_parser.add_argument('--out', help="write results JSON here (default: stdout)")
+
+    compare_parser = subparsers.add_parser('compare', help="flag slowdowns against a stored baseline")
+    compare_parser.add_argument('baseline', help="baseline results JSON")
+    compare_parser.add_argument('current', help="current results JSON")
+    compare_parser.add_argument('--threshold', type=float, default=0.15, help="allowed slowdown as a fraction")
+    compare_parser.add_argument('--min-ms', type=float, default=1.0, help="ignore baselines faster than this (noise floor)")
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        from benchmarks.suite import run_suite
+        results = run_suite(args.sizes, args.seed, args.sample, args.load_repeat, args.extractor_limit,
+                            args.section_stats)
+        output = json.dumps(results, indent=2)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                f.write(output)
+            print(f"Results saved to: {args.out}", file=sys.stderr)
+        else:
+            print(output)
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold, args.min_ms)
+    print(format_comparison(rows, args.threshold))
+    return 1 if any(row['regression'] for row in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Regression comparison between two benchmark result documents."""
+
+from typing import Dict, List
+
+# Timing fields where a larger value is a slowdown
+TIMING_FIELDS = ('p50_ms', 'p95_ms', 'total_s')
+
+def index_runs(results: Dict) -> Dict[int, Dict]:
+    """Map roster size -> metrics for a results document"""
+    return {run['agencies']: run['metrics'] for run in results.get('runs', [])}
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = 0.15, min_ms: float = 1.0) -> List[Dict]:
+    """Compare matching sizes/metrics and return one entry per timing field.
+
+    A field is flagged as a regression when the current value exceeds the
+    baseline by more than `threshold` (a fraction) and the baseline is above
+    `min_ms` milliseconds, so sub-noise timings are never flagged.
+    """
+    baseline_runs, current_runs = index_runs(baseline), index_runs(current)
+    rows = []
+    for size in sorted(set(baseline_runs) & set(current_runs)):
+        for metric, base in baseline_runs[size].items():
+            cur = current_runs[size].get(metric)
+            if not cur or 'skipped' in base or 'skipped' in cur:
+                continue
+            for field in TIMING_FIELDS:
+                if field not in base or field not in cur:
+                    continue
+                base_value, cur_value = base[field], cur[field]
+                base_ms = base_value * 1000 if field.endswith('_s') else base_value
+                change = (cur_value - base_value) / base_value if base_value else 0.0
+                rows.append({
+                    'agencies': size,
+                    'metric': metric,
+                    'field': field,
+                    'baseline': base_value,
+                    'current': cur_value,
+                    'change': change,
+                    'regression': base_ms >= min_ms and change > threshold
+                })
+    return rows
+
+def format_comparison(rows: List[Dict], threshold: float) -> str:
+    """Format comparison rows as a plain-text table"""
+    lines = [
+        f"Benchmark comparison (regression threshold: +{threshold:.0%})",
+        f"{'agencies':>9} {'metric':<26} {'field':<8} {'baseline':>12} {'current':>12} {'change':>8}"
+    ]
+    for row in rows:
+        flag = "  REGRESSION" if row['regression'] else ""
+        lines.append(
+            f"{row['agencies']:>9} {row['metric']:<26} {row['field']:<8} "
+            f"{row['baseline']:>12.4f} {row['current']:>12.4f} {row['change']:>+8.1%}{flag}"
+        )
+    regressions = sum(1 for row in rows if row['regression'])
+    lines.append(f"{regressions} regression(s) found.")
+    return "\n".join(lines)
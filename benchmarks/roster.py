@@ -0,0 +1,123 @@
+"""Synthetic agency roster generation for benchmarks."""
+
+import random
+from functools import lru_cache
+from datetime import datetime
+from typing import Dict
+
+import truPrompt
+
+# Rough share of agencies per RMS; "Custom" agencies use an RMS name that
+# is not in RMS_CONFIG and so fall back to the Default configuration.
+RMS_WEIGHTS = {
+    "New World": 30,
+    "Spillman Flex": 18,
+    "Zuercher": 14,
+    "Tritech": 10,
+    "OneSolutionRMS": 8,
+    "RIMS": 6,
+    "Cody": 4,
+    "Custom": 10
+}
+
+CUSTOM_RMS_NAMES = ["Mark43", "Central Square", "Caliber", "ImageTrend", "Hexagon"]
+
+STATES = ["OH", "TX", "CA", "NE", "PA", "SC", "AZ", "VT", "NY", "FL", "GA", "WA"]
+
+AGENCY_TYPES = [
+    ("Police Department", "PD"),
+    ("County Sheriff's Office", "SO"),
+    ("Township Police Department", "TPD"),
+    ("Marshal's Office", "MO")
+]
+
+NOTE_TEMPLATES = [
+    "Quirk: Search button sometimes requires a second click after the form loads",
+    "Workflow: Always click 'Initiate' before entering data",
+    "Navigation: Use the F{n} key to open the command line",
+    "Search: Partial addresses work better than full addresses",
+    "Data: Case numbers are formatted as {yy}-{n:04d}",
+    "Error: If login fails, check caps lock and retry once",
+    "Performance: Close sub-windows to preserve memory after every {n} lookups",
+    "Security: Session times out after {n} minutes of inactivity",
+    "Integration: NCIC queries must use the separate state switch application",
+    "Training: User manual available on the shared drive under RMS/Docs"
+]
+
+OTHER_SYSTEMS = ["NCIC", "CAD", "LEADS", "CopWare", "Mugshots", "LPR", "Jail Management"]
+
+# Every workflow in WORKFLOWS_DATABASE is a basic command, so additional_workflows
+# cannot vary the prompt; per-agency budgets and rankings decide which of these
+# workflows outside BUDGET_PROTECTED_WORKFLOWS are rendered in full and which are stubbed.
+BUDGET_RANGE = (4200, 4700)
+
+@lru_cache(maxsize=None)
+def _rankable_workflows():
+    return tuple(wf['Short Form'] for wf in truPrompt.WORKFLOWS_DATABASE
+                 if wf['Short Form'] not in truPrompt.BUDGET_PROTECTED_WORKFLOWS)
+
+def _weighted_rms(rng: random.Random) -> str:
+    names = list(RMS_WEIGHTS)
+    rms_name = rng.choices(names, weights=[RMS_WEIGHTS[n] for n in names])[0]
+    if rms_name == "Custom":
+        rms_name = rng.choice(CUSTOM_RMS_NAMES)
+    return rms_name
+
+def synthesize_agency(index: int, rng: random.Random) -> Dict:
+    """Build one agency record in the agency_data.json format"""
+    agency_type, suffix = rng.choice(AGENCY_TYPES)
+    city = f"{rng.choice(['North', 'South', 'East', 'West', 'New', 'Old', 'Port', 'Lake'])} {rng.choice(['Platte', 'Findlay', 'Lancaster', 'Kershaw', 'Butte', 'Burlington', 'Grande', 'Haven'])}{index}"
+    abbr = f"{''.join(w[0] for w in city.split()[:2]).upper()}{suffix}{index}"
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    note_count = rng.choices([0, 1, 3, 6, 12], weights=[35, 25, 20, 15, 5])[0]
+    notes = [
+        rng.choice(NOTE_TEMPLATES).format(n=rng.randint(1, 30), yy=rng.randint(10, 25))
+        for _ in range(note_count)
+    ]
+
+    system_count = rng.choices([0, 1, 2, 3], weights=[50, 30, 15, 5])[0]
+    other_systems = {
+        name: {'username': f"{name.lower().replace(' ', '')}_{index}", 'password': f"pw{rng.getrandbits(32):08x}"}
+        for name in rng.sample(OTHER_SYSTEMS, system_count)
+    }
+
+    rankable = _rankable_workflows()
+    ranked_count = rng.choices([0, 3, 8, len(rankable)], weights=[40, 30, 20, 10])[0]
+    workflow_mix = {}
+    if ranked_count:
+        workflow_mix['workflow_priority'] = rng.sample(rankable, ranked_count)
+    if rng.random() < 0.4:
+        workflow_mix['token_budget'] = rng.randint(*BUDGET_RANGE)
+
+    return {
+        'agency_name': f"{city} {agency_type}",
+        'agency_abbr': abbr,
+        'city': city,
+        'county': f"{rng.choice(['Butte', 'Lincoln', 'Hancock', 'Pinal', 'Berks', 'Kershaw'])} County",
+        'state': rng.choice(STATES),
+        'rms_name': _weighted_rms(rng),
+        'os_name': rng.choices(["Windows", "Linux", "macOS"], weights=[90, 7, 3])[0],
+        'rms_username': f"dp_{abbr.lower()}",
+        'rms_password': f"pw{rng.getrandbits(48):012x}",
+        'rms_user_notes': notes,
+        'other_systems': other_systems,
+        'additional_workflows': [],
+        **workflow_mix,
+        'signature': f"{rng.getrandbits(256):064x}",
+        'last_updated': now,
+        'source_files': []
+    }
+
+def synthesize_roster(count: int, seed: int = 7) -> Dict:
+    """Build an agency_data.json-shaped roster of `count` agencies"""
+    rng = random.Random(seed)
+    agencies = {}
+    for i in range(count):
+        agency = synthesize_agency(i, rng)
+        agencies[agency['agency_abbr']] = agency
+    return {
+        'processed_files': {},
+        'agencies': agencies,
+        'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    }
@@ -0,0 +1,198 @@
+"""End-to-end timing of truPrompt generation, loading and extraction."""
+
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List
+
+import truPrompt
+
+from benchmarks.roster import synthesize_roster
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'util'))
+
+import agency_extractor  # noqa: E402
+
+# --- Statistics ---
+
+def summarize(durations: List[float], total_bytes: int, wall_s: float = None) -> Dict:
+    """Summarize per-operation durations (seconds) into the result record format"""
+    total_s = wall_s if wall_s is not None else sum(durations)
+    return {
+        'count': len(durations),
+        'total_s': round(total_s, 6),
+        'p50_ms': round(truPrompt.percentile(durations, 50) * 1000, 4),
+        'p95_ms': round(truPrompt.percentile(durations, 95) * 1000, 4),
+        'bytes': total_bytes,
+        'bytes_per_s': round(total_bytes / total_s, 1) if total_s else 0.0
+    }
+
+@contextlib.contextmanager
+def working_directory(path: str):
+    """Temporarily chdir so the relative outputs/ paths land in scratch space"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+@contextlib.contextmanager
+def quiet():
+    """Swallow console output from the code under test"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+# --- Benchmarks ---
+
+def bench_generate_prompt(roster: Dict, sample: int) -> Dict:
+    """Time generate_prompt for up to `sample` agencies"""
+    durations, total_bytes = [], 0
+    for data in list(roster['agencies'].values())[:sample]:
+        generator = truPrompt.TruPromptGenerator(data, data.get('additional_workflows', []), data.get('signature'))
+        start = time.perf_counter()
+        prompt = generator.generate_prompt()
+        durations.append(time.perf_counter() - start)
+        total_bytes += len(prompt.encode('utf-8'))
+    return summarize(durations, total_bytes)
+
+def bench_sections(roster: Dict, sample: int) -> truPrompt.SectionProfiler:
+    """Render up to `sample` prompts with per-section instrumentation enabled"""
+    profiler = truPrompt.SectionProfiler(keep_per_agency=False)
+    for data in list(roster['agencies'].values())[:sample]:
+        truPrompt.TruPromptGenerator(
+            data, data.get('additional_workflows', []), data.get('signature'), profiler=profiler
+        ).generate_prompt()
+    return profiler
+
+def bench_batch_generation(roster: Dict) -> Dict:
+    """Time run_batch_generation over the whole roster into ./outputs, one run per workflow selection"""
+    groups = {}
+    for agency in truPrompt.list_available_agencies(roster):
+        workflows = tuple(roster['agencies'][agency['abbr']].get('additional_workflows', []))
+        groups.setdefault(workflows, []).append(agency)
+    durations, total_bytes, failed = [], 0, 0
+    start = time.perf_counter()
+    with quiet():
+        for workflows, available in groups.items():
+            results = truPrompt.run_batch_generation(roster, available, list(workflows), use_existing_signatures=True)
+            durations.extend(results['durations'])
+            total_bytes += results['bytes_written']
+            failed += len(results['failed'])
+    wall_s = time.perf_counter() - start
+    summary = summarize(durations, total_bytes, wall_s)
+    summary['failed'] = failed
+    return summary
+
+def bench_load_agency_data(path: str, repeat: int) -> Dict:
+    """Time load_agency_data on the roster file"""
+    size = os.path.getsize(path)
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        truPrompt.load_agency_data(path)
+        durations.append(time.perf_counter() - start)
+    return summarize(durations, size * repeat)
+
+def bench_load_list_agencies(path: str, repeat: int, lazy: bool = False) -> Dict:
+    """Time load_agency_data plus list_available_agencies, what the menu and batch pay before generating"""
+    size = os.path.getsize(path)
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        truPrompt.list_available_agencies(truPrompt.load_agency_data(path, lazy=lazy))
+        durations.append(time.perf_counter() - start)
+    return summarize(durations, size * repeat)
+
+def bench_record_memory(path: str) -> Dict:
+    """Traced bytes per agency held as parsed dicts vs. as AgencyRecords"""
+    tracemalloc.start()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            agencies = json.load(f)['agencies']
+        gc.collect()
+        dict_bytes = tracemalloc.get_traced_memory()[0]
+        records = {abbr: truPrompt.AgencyRecord(data) for abbr, data in agencies.items()}
+        del agencies
+        gc.collect()
+        record_bytes = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    count = len(records) or 1
+    return {
+        'count': len(records),
+        'dict_bytes_per_agency': round(dict_bytes / count),
+        'record_bytes_per_agency': round(record_bytes / count),
+        'ratio': round(dict_bytes / record_bytes, 2) if record_bytes else 0.0
+    }
+
+def bench_process_outputs_directory() -> Dict:
+    """Time the extractor over the generated ./outputs directory"""
+    total_bytes = sum(
+        os.path.getsize(os.path.join(agency_extractor.OUTPUTS_DIR, f))
+        for f in os.listdir(agency_extractor.OUTPUTS_DIR) if f.endswith('.txt')
+    )
+    with quiet():
+        processor = agency_extractor.AgencyProcessor()
+        start = time.perf_counter()
+        results = processor.process_outputs_directory()
+        wall_s = time.perf_counter() - start
+    summary = summarize([wall_s], total_bytes, wall_s)
+    summary['files'] = results.get('processed', 0)
+    summary['per_file_ms'] = round(wall_s * 1000 / summary['files'], 4) if summary['files'] else 0.0
+    return summary
+
+def run_size(count: int, seed: int, sample: int, load_repeat: int, extractor_limit: int,
+             section_stats: bool = False) -> Dict:
+    """Run every benchmark against one synthetic roster size"""
+    roster = synthesize_roster(count, seed)
+    metrics = {'generate_prompt': bench_generate_prompt(roster, sample)}
+    sections = bench_sections(roster, sample) if section_stats else None
+
+    with tempfile.TemporaryDirectory(prefix='truprompt_bench_') as workdir, working_directory(workdir):
+        os.makedirs('outputs', exist_ok=True)
+        data_path = os.path.join('outputs', 'agency_data.json')
+        with open(data_path, 'w', encoding='utf-8') as f:
+            json.dump(roster, f, indent=2)
+
+        metrics['load_agency_data'] = bench_load_agency_data(data_path, load_repeat)
+        metrics['load_list_agencies'] = bench_load_list_agencies(data_path, load_repeat)
+        metrics['load_list_agencies_lazy'] = bench_load_list_agencies(data_path, load_repeat, lazy=True)
+        metrics['agency_record_memory'] = bench_record_memory(data_path)
+        metrics['batch_generation'] = bench_batch_generation(roster)
+        if count <= extractor_limit:
+            metrics['process_outputs_directory'] = bench_process_outputs_directory()
+        else:
+            metrics['process_outputs_directory'] = {'skipped': f"roster larger than --extractor-limit ({extractor_limit})"}
+
+    run = {'agencies': count, 'metrics': metrics}
+    if sections is not None:
+        run['sections'] = sections.summary()
+        print(f"\nSection breakdown ({count} agencies):\n{sections.format_table()}\n", file=sys.stderr)
+    return run
+
+def run_suite(sizes: List[int], seed: int = 7, sample: int = 2000, load_repeat: int = 5,
+              extractor_limit: int = 5000, section_stats: bool = False) -> Dict:
+    """Run the full suite and return a JSON-serializable results document"""
+    runs = []
+    for count in sizes:
+        print(f"Benchmarking {count} agencies...", file=sys.stderr)
+        runs.append(run_size(count, seed, sample, load_repeat, extractor_limit, section_stats))
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': seed,
+            'sample': sample
+        },
+        'runs': runs
+    }
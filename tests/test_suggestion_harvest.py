@@ -0,0 +1,50 @@
+"""Regression tests for the suggestion harvester."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import truPrompt  # noqa: E402
+
+RIMS_AGENCY = {
+    'agency_name': "Lancaster Police Department",
+    'agency_abbr': "LPD",
+    'city': "Lancaster",
+    'county': "Lancaster County",
+    'state': "PA",
+    'os_name': "Windows",
+    'rms_name': "RIMS",
+    'rms_username': "dp_lpd",
+    'rms_password': "pw-lpd",
+    'other_systems': {}
+}
+
+def _write_transcripts(directory, count, reply):
+    for profile in ('full', 'compact'):
+        prompt = truPrompt.TruPromptGenerator(RIMS_AGENCY, [], "0" * 64, render_profile=profile).generate_prompt()
+        for i in range(count):
+            with open(os.path.join(directory, f"{profile}_{i}.txt"), 'w', encoding='utf-8') as f:
+                f.write(f"{prompt}\n\nUser: _PRL|Smith|John\nAgent: {reply}\n")
+
+def test_prompt_format_example_is_not_harvested(tmp_path):
+    _write_transcripts(str(tmp_path), 3, "Cannot locate")
+    result = truPrompt.harvest_suggestions([str(tmp_path)], jobs=1)
+    assert result['blocks'] == 0
+    assert result['patches'] == []
+
+def test_real_blocks_survive_alongside_the_prompt(tmp_path):
+    reply = ("I recommend the following additions or changes to the system prompt to improve efficiency: "
+             "[SUGGESTION 1: Close sub-windows after every lookup] {CHANGE 1: Click Search | Press Enter to search}")
+    _write_transcripts(str(tmp_path), 1, reply)
+    blocks = truPrompt.extract_suggestion_blocks(os.path.join(str(tmp_path), "full_0.txt"))
+    assert [b.get('text') or (b['old'], b['new']) for b in blocks] == [
+        "Close sub-windows after every lookup", ("Click Search", "Press Enter to search")
+    ]
+    assert all(b['rms'] == "RIMS" for b in blocks)
+
+def test_placeholder_bodies_are_rejected(tmp_path):
+    path = os.path.join(str(tmp_path), "placeholders.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Agent: [SUGGESTION 3: ...] {CHANGE 4: <old> | <new>} {CHANGE 5: Click Go | <new>}\n")
+    assert truPrompt.extract_suggestion_blocks(path) == []
@@ -15,15 +15,21 @@ Features:
 """
 
 import os
-import re
+import sys
 import json
+import time
 from datetime import datetime
 from typing import Dict, List, Optional
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from truPrompt import RunMetrics, extract_agency_fields  # noqa: E402
+
 # --- Configuration ---
 OUTPUTS_DIR = "outputs"
 LOG_FILE = "agency_extraction_log.txt"
 AGENCY_DATA_FILE = "outputs/agency_data.json"
+METRICS_DIR = None  # None uses truPrompt.METRICS_DIR
 
 # --- Logging Class ---
 class Logger:
@@ -66,58 +72,7 @@ class AgencyDataExtractor:
             with open(file_path, 'r', encoding='utf-8') as f:
                 content = f.read()
             
-            # Extract agency information from Section 1
-            agency_data = {}
-            
-            # Agency Name
-            name_match = re.search(r'\* Agency Name: `([^`]+)`', content)
-            if name_match:
-                agency_data['agency_name'] = name_match.group(1)
-            
-            # Agency Abbreviation
-            abbr_match = re.search(r'\* Agency Abbreviation: `([^`]+)`', content)
-            if abbr_match:
-                agency_data['agency_abbr'] = abbr_match.group(1)
-            
-            # City
-            city_match = re.search(r'\* City: `([^`]+)`', content)
-            if city_match:
-                agency_data['city'] = city_match.group(1)
-            
-            # County
-            county_match = re.search(r'\* County: `([^`]+)`', content)
-            if county_match:
-                agency_data['county'] = county_match.group(1)
-            
-            # State
-            state_match = re.search(r'\* State: `([^`]+)`', content)
-            if state_match:
-                agency_data['state'] = state_match.group(1)
-            
-            # RMS Name
-            rms_match = re.search(r'\* Records Management System \(RMS\): `([^`]+)`', content)
-            if rms_match:
-                agency_data['rms_name'] = rms_match.group(1)
-            
-            # Operating System
-            os_match = re.search(r'\* Operating System: `([^`]+)`', content)
-            if os_match:
-                agency_data['os_name'] = os_match.group(1)
-            
-            # Extract existing signature if present
-            sig_match = re.search(r'\* \*\*Secure Signature\*\*: `([^`]+)`', content)
-            if sig_match:
-                agency_data['existing_signature'] = sig_match.group(1)
-            
-            # Extract credentials
-            rms_user_match = re.search(r'\* \*\*RMS Username\*\*: `([^`]+)`', content)
-            if rms_user_match:
-                agency_data['rms_username'] = rms_user_match.group(1)
-            
-            rms_pass_match = re.search(r'\* \*\*RMS Password\*\*: `([^`]+)`', content)
-            if rms_pass_match:
-                agency_data['rms_password'] = rms_pass_match.group(1)
-            
+            agency_data = extract_agency_fields(content)
             return agency_data if agency_data else None
             
         except Exception as e:
@@ -273,9 +228,26 @@ class AgencyProcessor:
         self.data_manager = AgencyDataManager(AGENCY_DATA_FILE, self.logger)
     
     def process_outputs_directory(self) -> Dict:
-        """Process all files in the outputs directory"""
+        """Process all files in the outputs directory and write run metrics"""
+        metrics = RunMetrics('truprompt_extract')
+        try:
+            results = self._process_outputs_directory(metrics)
+        except Exception as e:
+            metrics.record_failure(e)
+            raise
+        finally:
+            metrics.finish()
+            try:
+                prom_path, _ = metrics.write(METRICS_DIR)
+                self.logger.log(f"Run metrics saved to: {prom_path}")
+            except OSError as e:
+                self.logger.log_error(f"Failed to write run metrics: {e}")
+        return results
+    
+    def _process_outputs_directory(self, metrics: RunMetrics) -> Dict:
         if not os.path.exists(OUTPUTS_DIR):
             self.logger.log_error(f"Outputs directory '{OUTPUTS_DIR}' not found")
+            metrics.record_failure('OutputsDirectoryMissing')
             return {}
         
         results = {
@@ -305,6 +277,8 @@ class AgencyProcessor:
                 new_files.append(filename)
             else:
                 results['skipped_files'] += 1
+                metrics.increment('files_skipped')
+                metrics.increment('cache_hits')
                 self.logger.log(f"Skipping already processed file: {filename}")
         
         if not new_files:
@@ -317,6 +291,8 @@ class AgencyProcessor:
             file_path = os.path.join(OUTPUTS_DIR, filename)
             results['processed'] += 1
             results['new_files'] += 1
+            metrics.increment('agencies_processed')
+            started = time.perf_counter()
             
             self.logger.log(f"Analyzing new file: {filename}")
             
@@ -326,6 +302,8 @@ class AgencyProcessor:
             if not agency_data:
                 self.logger.log_error(f"Could not extract agency data from {filename}")
                 results['failed'] += 1
+                metrics.record_failure('NoAgencyData')
+                metrics.observe(time.perf_counter() - started)
                 continue
             
             # Store agency data
@@ -346,10 +324,16 @@ class AgencyProcessor:
                 # Mark file as processed and store agency data
                 file_hash = self.data_manager.get_file_hash(file_path)
                 self.data_manager.mark_file_processed(file_path, agency_data, file_hash)
+                metrics.increment('agencies_succeeded')
                 
                 self.logger.log_success(f"Successfully analyzed {filename}")
             else:
                 results['failed'] += 1
+                metrics.record_failure('AnalysisFailed')
+            metrics.observe(time.perf_counter() - started)
+        
+        if results['new_files'] and os.path.exists(self.data_manager.agency_data_file):
+            metrics.increment('bytes_written', os.path.getsize(self.data_manager.agency_data_file))
         
         return results
     
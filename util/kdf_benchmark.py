@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Credential KDF Benchmark
+========================
+
+Times PBKDF2 key derivation at several iteration counts against the wall time
+of a full encrypted batch run, so an iteration count can be picked that still
+fits the nightly regeneration window.
+
+Features:
+- Cold (uncached) PBKDF2 derivation time per iteration count
+- Batch wall time: derivation + one-pass credential encryption + prompt generation
+- Synthetic agencies by default, or the real roster via --agency-data
+- No files are written (prompts are generated in memory only)
+"""
+
+import os
+import sys
+import time
+import json
+import argparse
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import truPrompt  # noqa: E402
+
+# --- Configuration ---
+DEFAULT_ITERATIONS = [100000, 210000, 390000, 600000, 1000000]
+DEFAULT_AGENCY_COUNT = 200
+BENCHMARK_PASSPHRASE = "kdf-benchmark-passphrase"
+
+def build_synthetic_agencies(count: int) -> Dict[str, Dict]:
+    """Build a minimal roster of agencies spread across the configured RMS systems"""
+    rms_names = [name for name in truPrompt.RMS_CONFIG if name != "Default"]
+    agencies = {}
+    for i in range(count):
+        abbr = f"BA{i:05d}"
+        agencies[abbr] = {
+            'agency_name': f"Benchmark Agency {i}",
+            'agency_abbr': abbr,
+            'city': "Benchville",
+            'county': "Bench County",
+            'state': "TS",
+            'os_name': "Windows",
+            'rms_name': rms_names[i % len(rms_names)],
+            'rms_username': f"user{i}",
+            'rms_password': f"pass{i}!",
+            'other_systems': {'NCIC': {'username': f"ncic{i}", 'password': f"ncicpass{i}"}} if i % 3 == 0 else {}
+        }
+    return agencies
+
+def time_batch(agencies: Dict[str, Dict], iterations: int) -> Dict:
+    """Run one encrypted batch at the given cost and return its timings in seconds"""
+    truPrompt.CredentialVault.clear_key_cache()
+    vault = truPrompt.CredentialVault(BENCHMARK_PASSPHRASE, iterations=iterations)
+
+    start = time.perf_counter()
+    vault.derive_key()
+    derive_s = time.perf_counter() - start
+
+    encrypt_s = 0.0
+    blobs = {}
+    if truPrompt.CRYPTOGRAPHY_AVAILABLE:
+        encrypt_start = time.perf_counter()
+        blobs = vault.encrypt_batch(agencies)
+        encrypt_s = time.perf_counter() - encrypt_start
+
+    generate_start = time.perf_counter()
+    for abbr, data in agencies.items():
+        generator = truPrompt.TruPromptGenerator(
+            data, [], data.get('signature'),
+            vault if blobs else None, blobs.get(abbr)
+        )
+        generator.generate_prompt()
+    generate_s = time.perf_counter() - generate_start
+
+    return {
+        'iterations': iterations,
+        'derive_s': derive_s,
+        'encrypt_s': encrypt_s,
+        'generate_s': generate_s,
+        'batch_s': time.perf_counter() - start
+    }
+
+def run_benchmark(agencies: Dict[str, Dict], iteration_counts: List[int], repeat: int) -> List[Dict]:
+    """Benchmark every iteration count, keeping the fastest of `repeat` runs"""
+    results = []
+    for iterations in iteration_counts:
+        runs = [time_batch(agencies, iterations) for _ in range(repeat)]
+        results.append(min(runs, key=lambda r: r['batch_s']))
+    return results
+
+def format_report(results: List[Dict], agency_count: int) -> str:
+    """Format benchmark results as a plain-text table"""
+    lines = [
+        f"PBKDF2-HMAC-SHA256 cost vs. batch wall time ({agency_count} agencies)",
+        f"{'iterations':>12} {'derive (s)':>11} {'encrypt (s)':>12} {'generate (s)':>13} {'batch (s)':>10} {'kdf share':>10}",
+    ]
+    for r in results:
+        share = r['derive_s'] / r['batch_s'] if r['batch_s'] else 0.0
+        lines.append(
+            f"{r['iterations']:>12,} {r['derive_s']:>11.3f} {r['encrypt_s']:>12.3f} "
+            f"{r['generate_s']:>13.3f} {r['batch_s']:>10.3f} {share:>9.1%}"
+        )
+    if not truPrompt.CRYPTOGRAPHY_AVAILABLE:
+        lines.append("Note: 'cryptography' not installed - encryption pass skipped, prompts generated in plaintext mode.")
+    return "\n".join(lines)
+
+def main():
+    """Main execution function"""
+    parser = argparse.ArgumentParser(description="Benchmark PBKDF2 iteration counts against batch wall time.")
+    parser.add_argument('--agencies', type=int, default=DEFAULT_AGENCY_COUNT, help="number of synthetic agencies")
+    parser.add_argument('--agency-data', help="benchmark against an existing agency_data.json instead")
+    parser.add_argument('--iterations', type=int, nargs='+', default=DEFAULT_ITERATIONS, help="iteration counts to test")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per iteration count (fastest is kept)")
+    parser.add_argument('--json', action='store_true', help="print results as JSON")
+    args = parser.parse_args()
+
+    if args.agency_data:
+        with open(args.agency_data, 'r', encoding='utf-8') as f:
+            agencies = json.load(f).get('agencies', {})
+    else:
+        agencies = build_synthetic_agencies(args.agencies)
+
+    results = run_benchmark(agencies, args.iterations, args.repeat)
+    if args.json:
+        print(json.dumps({'agencies': len(agencies), 'results': results}, indent=2))
+    else:
+        print(format_report(results, len(agencies)))
+
+if __name__ == "__main__":
+    main()